@@ -15,11 +15,51 @@ class Analytics:
     def __init__(self):
         # store timestamps (epoch seconds) of served customers for simulation and computation
         self.served_timestamps = []  # list of floats
+        # tokens that expired (stale or no-show), as produced by ExpiryManager
+        self.expired_entries = []  # list of dicts {item, container, reason, expired_at}
 
     def record_service(self, timestamp:float=None):
         """Record that a service happened at timestamp (default now)."""
         self.served_timestamps.append(timestamp if timestamp else time.time())
 
+    def unrecord_service(self, timestamp:float):
+        """Withdraw a recorded service (e.g. the called customer did not show up)."""
+        for i in range(len(self.served_timestamps) - 1, -1, -1):
+            if self.served_timestamps[i] == timestamp:
+                del self.served_timestamps[i]
+                return
+
+    def record_expiry(self, entry:Dict):
+        """Record an expired token (entry from ExpiryManager.expire / no_show)."""
+        self.expired_entries.append(entry)
+
+    def pop_expired_batch(self) -> List[Dict]:
+        """
+        Remove and return the most recent expiry batch (entries sharing the last expired_at),
+        for restoring them to their queues. Returns [] if nothing expired.
+        """
+        if not self.expired_entries:
+            return []
+        last = self.expired_entries[-1]["expired_at"]
+        i = len(self.expired_entries)
+        while i > 0 and self.expired_entries[i - 1]["expired_at"] == last:
+            i -= 1
+        batch = self.expired_entries[i:]
+        del self.expired_entries[i:]
+        return batch
+
+    def expiry_counts(self) -> Dict:
+        """
+        Count expired tokens by reason and by user type.
+        Returns dict {'total': int, 'by_reason': {...}, 'by_type': {...}}
+        """
+        by_reason, by_type = {}, {}
+        for e in self.expired_entries:
+            by_reason[e['reason']] = by_reason.get(e['reason'], 0) + 1
+            t = e['item'].get('type')
+            by_type[t] = by_type.get(t, 0) + 1
+        return {"total": len(self.expired_entries), "by_reason": by_reason, "by_type": by_type}
+
     def average_wait_time(self, recorded_waits:List[float]) -> float:
         """
         Compute average wait from a list of waits (seconds).
@@ -42,37 +82,43 @@ class Analytics:
         idx = int(np.argmax(counts))
         return {"hour": int(vals[idx]), "count": int(counts[idx])}
 
-    def generate_ascii_graph(self, buckets:int=10) -> str:
+    def hourly_counts(self) -> List[int]:
+        """Return served counts per hour of day (0-23) from served_timestamps."""
+        counts = [0]*24
+        for ts in self.served_timestamps:
+            counts[time.localtime(ts).tm_hour] += 1
+        return counts
+
+    def generate_ascii_graph(self, buckets:int=10, counts:List[int]=None) -> str:
         """
         Generate a tiny ASCII bar graph for counts per hour (0-23) aggregated into buckets.
+        counts: precomputed per-hour counts (e.g. from a storage backend); computed from
+        served_timestamps if omitted.
         """
-        if not self.served_timestamps:
+        if counts is None:
+            counts = self.hourly_counts()
+        if not any(counts):
             return "No data to display."
-        hours = [time.localtime(ts).tm_hour for ts in self.served_timestamps]
-        counts = [0]*24
-        for h in hours:
-            counts[h] += 1
         # format to string
         lines = []
         for hour in range(24):
             lines.append(f"{hour:02d}: " + "#" * counts[hour])
         return "\n".join(lines)
 
-    def generate_matplotlib_bar(self):
+    def generate_matplotlib_bar(self, counts:List[int]=None):
         """
         Produce a PNG image (base64) of served counts per hour for Streamlit image display.
+        counts: optional precomputed per-hour counts, as for generate_ascii_graph.
         Returns bytes data of PNG.
         """
-        if not self.served_timestamps:
+        if counts is None:
+            counts = self.hourly_counts()
+        if not any(counts):
             # create empty plot with message
             fig, ax = plt.subplots(figsize=(8,3))
             ax.text(0.5, 0.5, "No data", ha='center', va='center', fontsize=14)
             ax.axis('off')
         else:
-            hours = [time.localtime(ts).tm_hour for ts in self.served_timestamps]
-            counts = [0]*24
-            for h in hours:
-                counts[h] += 1
             fig, ax = plt.subplots(figsize=(10,4))
             ax.bar(range(24), counts)
             ax.set_xlabel("Hour of day")
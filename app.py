@@ -3,10 +3,16 @@ import streamlit as st
 from queue_manager import QueueManager
 from priority_manager import PriorityManager
 from service_counter import ServiceCounterManager
+from service_lines import ServiceLineManager
 from user_search import UserSearch
 from analytics import Analytics
+from change_feed import ChangeFeed
+from expiry import ExpiryManager
 from undo_stack import UndoStack
 from file_handler import FileHandler
+from sqlite_backend import SQLiteBackend
+import json
+import os
 import time
 import pandas as pd
 import numpy as np
@@ -18,10 +24,19 @@ st.set_page_config(page_title="SmartQueue — Intelligent Queue Management", lay
                    initial_sidebar_state="expanded")
 
 # Use session_state to persist managers across interactions
+if "feed" not in st.session_state:
+    # position changes published by the managers; lets the token watch skip work when nothing moved
+    st.session_state.feed = ChangeFeed()
 if "qm" not in st.session_state:
-    st.session_state.qm = QueueManager(avg_service_time_seconds=180)  # default 3 minutes
+    st.session_state.qm = QueueManager(avg_service_time_seconds=180, feed=st.session_state.feed)  # default 3 minutes
 if "pm" not in st.session_state:
-    st.session_state.pm = PriorityManager()
+    st.session_state.pm = PriorityManager(feed=st.session_state.feed)
+if "sl" not in st.session_state:
+    # the default "General" line is backed by qm / pm; extra lines are created by admins
+    st.session_state.sl = ServiceLineManager(st.session_state.qm, st.session_state.pm)
+if "em" not in st.session_state:
+    # TTL / no-show expiry per user type; new tokens are picked up from the change feed
+    st.session_state.em = ExpiryManager(st.session_state.sl, st.session_state.feed)
 if "sm" not in st.session_state:
     st.session_state.sm = ServiceCounterManager()
 if "us" not in st.session_state:
@@ -31,10 +46,18 @@ if "an" not in st.session_state:
 if "undo" not in st.session_state:
     st.session_state.undo = UndoStack()
 if "fh" not in st.session_state:
-    st.session_state.fh = FileHandler("smartqueue_state.json")
+    # SMARTQUEUE_STORAGE=sqlite switches to the embedded database (row-level writes);
+    # the default stays the single JSON file.
+    if os.environ.get("SMARTQUEUE_STORAGE", "json").lower() == "sqlite":
+        st.session_state.fh = SQLiteBackend("smartqueue_state.db")
+    else:
+        st.session_state.fh = FileHandler("smartqueue_state.json")
 
+feed = st.session_state.feed
 qm = st.session_state.qm
 pm = st.session_state.pm
+sl = st.session_state.sl
+em = st.session_state.em
 sm = st.session_state.sm
 us = st.session_state.us
 an = st.session_state.an
@@ -43,19 +66,40 @@ fh = st.session_state.fh
 
 # Load persisted state if any
 if "loaded" not in st.session_state:
-    loaded = fh.load_from_file(qm, pm, sm, an, undo)
+    loaded = fh.load_from_file(qm, pm, sm, an, undo, service_lines=sl, expiry_manager=em)
     st.session_state.loaded = True if loaded else False
 
 # Demo dataset: create some sample users if queue empty (only once)
 if not qm.queue and not pm.heap:
-    demo_names = ["Anita", "Ravi", "Sunil", "Maya"]
-    for n in demo_names:
-        qm.enqueue(n, "Normal")
-    # add one VIP and one emergency
-    vip = pm.add_priority_customer(qm.next_token, "Dr. Roy", priority_level=5, user_type="VIP")
-    qm.next_token += 1  # ensure unique tokens
-    emergency = pm.add_priority_customer(qm.next_token, "Emergency-X", priority_level=10, user_type="Emergency")
-    qm.next_token += 1
+    with fh.batch():
+        demo_names = ["Anita", "Ravi", "Sunil", "Maya"]
+        for n in demo_names:
+            fh.add_queue_entry(qm.enqueue(n, "Normal"))
+        # add one VIP and one emergency
+        vip = pm.add_priority_customer(qm.next_token, "Dr. Roy", priority_level=5, user_type="VIP")
+        qm.next_token += 1  # ensure unique tokens
+        emergency = pm.add_priority_customer(qm.next_token, "Emergency-X", priority_level=10, user_type="Emergency")
+        qm.next_token += 1
+        fh.add_priority_entry(vip)
+        fh.add_priority_entry(emergency)
+        fh.set_meta("next_token", qm.next_token)
+    sl.touch(qm.line)
+
+def record_expired(entries):
+    """Keep expired tokens for analytics and restoring, and mirror them into the storage backend."""
+    with fh.batch():
+        for entry in entries:
+            an.record_expiry(entry)
+            fh.record_expiry(entry)
+            if entry["container"] == "normal":
+                fh.remove_queue_entry(entry["item"]["token"])
+            else:
+                fh.remove_priority_entry(entry["item"]["token"])
+
+# Expire stale tokens; only tokens whose deadline has passed are touched
+expired_now = em.expire()
+if expired_now:
+    record_expired(expired_now)
 
 # -------------------------
 # Layout: Sidebar (Admin) & Main (User + Queue)
@@ -72,64 +116,176 @@ st.markdown("""
 # Sidebar - admin controls
 with st.sidebar:
     st.markdown("## Admin Panel")
+    st.markdown("**Service lines**")
+    with st.expander("Manage lines"):
+        cols = st.columns([2,1])
+        new_line = cols[0].text_input("Add line (e.g., Billing)", key="new_line")
+        if cols[1].button("Add", key="add_line"):
+            if new_line:
+                sl.add_line(new_line)
+                fh.add_line(new_line)
+                st.success(f"Line {new_line} added.")
+        policy = st.selectbox("Dispatch policy", list(sl.POLICIES), index=list(sl.POLICIES).index(sl.policy),
+                              help="oldest: serve the line whose next customer waited longest; "
+                                   "longest: serve the line with most people waiting")
+        if policy != sl.policy:
+            sl.set_policy(policy)
+            fh.set_meta("dispatch_policy", policy)
+    st.markdown("Lines: " + ", ".join(sl.line_names()))
+
     st.markdown("**Service counters**")
     with st.expander("Manage counters"):
         cols = st.columns([2,1])
         new_counter = cols[0].text_input("Add counter id (e.g., C1)", key="new_counter")
+        counter_lines = st.multiselect("Lines served (empty = all)", sl.line_names(), key="counter_lines")
         if cols[1].button("Add", key="add_counter"):
             if new_counter:
-                sm.push_counter(new_counter)
+                sm.push_counter(new_counter, counter_lines or None)
+                fh.add_counter(new_counter, counter_lines or None)
                 st.success(f"Counter {new_counter} added.")
-    st.markdown("Available counters: " + (", ".join(sm.available_counters()) if sm.available_counters() else "None"))
+
+    def counter_label(c):
+        lines = sm.counter_lines(c)
+        return f"{c} ({'/'.join(lines)})" if lines else c
+    st.markdown("Available counters: " + (", ".join(counter_label(c) for c in sm.available_counters()) if sm.available_counters() else "None"))
 
     st.markdown("---")
     st.markdown("**Queue actions**")
     col1, col2 = st.columns(2)
     if col1.button("Serve next customer", key="serve_next"):
-        # Serve priority first
-        served = None
-        served_source = None
-        counter = sm.pop_counter()
-        if counter is None:
+        # The dispatcher picks the best line the counter can serve; priority first within it
+        if not sm.available_counters():
             st.warning("No available counters. Add a counter first.")
         else:
-            # priority first
-            p = pm.get_next_priority_customer()
-            if p:
-                served = p
-                served_source = "priority"
+            assignment = sl.serve_next(sm)
+            if assignment is None:
+                st.info("No waiting customers for the available counters.")
             else:
-                item = qm.dequeue()
-                if item:
-                    served = item
-                    served_source = "normal"
-            if served:
-                # record for analytics
-                an.record_service(time.time())
-                # store undo info
-                if served_source == "priority":
-                    undo.push_operation('dequeue_priority', {"item": served.to_dict()})
-                else:
-                    undo.push_operation('dequeue', {"item": served.to_dict()})
-                st.success(f"Served {served.name} (Token {served.token}) at counter {counter}.")
+                served = assignment["item"]
+                served_source = assignment["source"]
+                counter = assignment["counter"]
+                with fh.batch():
+                    fh.remove_counter(counter)
+                    # record for analytics
+                    served_at = time.time()
+                    an.record_service(served_at)
+                    fh.record_service(served_at, served.token, counter)
+                    # store undo info
+                    if served_source == "priority":
+                        fh.remove_priority_entry(served.token)
+                        undo.push_operation('dequeue_priority', {"item": served.to_dict()})
+                        fh.push_undo('dequeue_priority', {"item": served.to_dict()})
+                    else:
+                        fh.remove_queue_entry(served.token)
+                        undo.push_operation('dequeue', {"item": served.to_dict()})
+                        fh.push_undo('dequeue', {"item": served.to_dict()})
+                st.session_state.last_called = {"item": served, "source": served_source, "counter": counter,
+                                                "served_at": served_at}
+                st.success(f"Served {served.name} (Token {served.token}) from {assignment['line']} at counter {counter}.")
     if col2.button("Undo last action"):
-        undo_last_operation()
+        # revert inside the line the operation touched
+        line = sl.default_line
+        if undo.stack:
+            data = undo.stack[-1]["data"]
+            line = data.get("item", {}).get("line") or sl.locate(data.get("token")) or sl.default_line
+        lqm, lpm = sl.get_line(line) if line in sl.lines else (qm, pm)
+        res = undo.undo_last_operation(lqm, lpm, sm)
+        if res:
+            sl.touch(lqm.line)
+            # mirror the reverted change into the storage backend
+            with fh.batch():
+                fh.pop_undo()
+                token = res.get("token")
+                if res["undone"] == "enqueue":
+                    fh.remove_queue_entry(token)
+                elif res["undone"] == "dequeue" and token in lqm.token_map:
+                    fh.add_queue_entry(lqm.token_map[token], front=True)
+                elif res["undone"] == "remove" and token in lqm.token_map:
+                    fh.add_queue_entry(lqm.token_map[token])
+                elif res["undone"] == "remove_priority" and token in lpm.token_map:
+                    fh.add_priority_entry(lpm.token_map[token])
+            # an undone serve puts the called customer back, so there is no one to mark as a no-show
+            last = st.session_state.get("last_called")
+            if last and sl.locate(last["item"].token) is not None:
+                del st.session_state["last_called"]
         if res:
             st.success(f"Undo result: {res}")
         else:
             st.info("Nothing to undo.")
 
+    if st.button("Called customer didn't show", key="no_show"):
+        last = st.session_state.pop("last_called", None)
+        if last is None:
+            st.info("No called customer to mark.")
+        else:
+            item, source, counter = last["item"], last["source"], last["counter"]
+            outcome = em.no_show(item, source)
+            # the no-show outcome replaces the serve: withdraw its service record and undo entry,
+            # and free the counter
+            with fh.batch():
+                if outcome["action"] != "waiting":
+                    an.unrecord_service(last["served_at"])
+                    fh.remove_service(last["served_at"], item.token)
+                    top = undo.stack[-1] if undo.stack else None
+                    if top and top["action"] in ("dequeue", "dequeue_priority") and top["data"]["item"]["token"] == item.token:
+                        undo.stack.pop()
+                        fh.pop_undo()
+                    sm.push_counter(counter)
+                    fh.add_counter(counter)
+                if outcome["action"] == "skipped":
+                    lqm, lpm = sl.get_line(item.line)
+                    if source == "normal":
+                        fh.add_queue_entry(item)
+                    else:
+                        fh.add_priority_entry(lpm.token_map[item.token])
+            if outcome["action"] == "waiting":
+                st.info(f"Token {item.token} is already back in the queue.")
+            elif outcome["action"] == "skipped":
+                where = "to the back of the line" if source == "normal" else "behind the next priority customer"
+                st.info(f"Token {item.token} moved {where} (no-show {outcome['call_outs']}).")
+            else:
+                record_expired([outcome["entry"]])
+                st.warning(f"Token {item.token} expired after repeated no-shows.")
+
+    # expiries are not part of the undo stack, so an admin's undo never reverts a sweep
+    if st.button("Restore last expired tokens", key="restore_expired"):
+        batch = an.pop_expired_batch()
+        if not batch:
+            st.info("No expired tokens to restore.")
+        else:
+            tokens = em.restore(batch)
+            with fh.batch():
+                for entry in batch:
+                    fh.remove_expiry(entry)
+                # same order as restore() re-added them, so front inserts line up
+                for t in tokens:
+                    rqm, rpm = sl.get_line(sl.locate(t))
+                    if t in rqm.token_map:
+                        fh.add_queue_entry(rqm.token_map[t], front=True)
+                    else:
+                        fh.add_priority_entry(rpm.token_map[t])
+                # the restore times travel with the expiry settings
+                fh.set_meta("expiry_policies", json.dumps(em.to_dict()))
+            st.success(f"Restored tokens {', '.join(map(str, tokens))}.")
+
     st.markdown("---")
     st.markdown("**Remove by token**")
     remove_token = st.text_input("Token to remove", key="remove_token")
     if st.button("Remove", key="remove_button"):
         try:
             t = int(remove_token)
-            removed = us.remove_user(t, qm, pm)
+            removed = sl.remove(t)
             if removed:
                 # push to undo stack
                 container = 'normal' if hasattr(removed, 'type') and removed.type != 'VIP' and removed.type != 'Emergency' else 'priority'
-                undo.push_operation('remove', {"item": removed.to_dict() if hasattr(removed, "to_dict") else {}, "container": container})
+                undo_data = {"item": removed.to_dict() if hasattr(removed, "to_dict") else {}, "container": container}
+                undo.push_operation('remove', undo_data)
+                with fh.batch():
+                    if container == 'normal':
+                        fh.remove_queue_entry(t)
+                    else:
+                        fh.remove_priority_entry(t)
+                    fh.push_undo('remove', undo_data)
                 st.success(f"Removed token {t} ({removed.name if hasattr(removed, 'name') else 'unknown'}).")
             else:
                 st.warning("Token not found.")
@@ -139,10 +295,10 @@ with st.sidebar:
     st.markdown("---")
     st.markdown("**Persistence**")
     if st.button("Save state", key="save_state"):
-        path = fh.save_to_file(qm, pm, sm, an, undo)
+        path = fh.save_to_file(qm, pm, sm, an, undo, service_lines=sl, expiry_manager=em)
         st.success(f"Saved to {path}")
     if st.button("Load state", key="load_state"):
-        ok = fh.load_from_file(qm, pm, sm, an, undo)
+        ok = fh.load_from_file(qm, pm, sm, an, undo, service_lines=sl, expiry_manager=em)
         if ok:
             st.success("Loaded state.")
         else:
@@ -152,9 +308,28 @@ with st.sidebar:
     st.markdown("**Settings**")
     avg_min = st.number_input("Average service time (seconds)", min_value=30, max_value=3600, value=int(qm.avg_service_time))
     if st.button("Update avg service time", key="update_avg"):
-        qm.avg_service_time = int(avg_min)
+        for lqm, _ in sl.lines.values():
+            lqm.avg_service_time = int(avg_min)
+        fh.set_meta("avg_service_time", qm.avg_service_time)
         st.success("Average service time updated.")
 
+    with st.expander("Token expiry"):
+        st.caption("Tokens older than the TTL are dropped; after the given number of no-shows a called token expires (earlier no-shows skip it: normal tokens go to the back of the line, priority tokens behind the next customer).")
+        new_policies = {}
+        for user_type in em.USER_TYPES:
+            policy = em.policies[user_type]
+            cols = st.columns(2)
+            ttl_min = cols[0].number_input(f"{user_type} TTL (min, 0 = never)", min_value=0, max_value=24 * 60,
+                                           value=int((policy.ttl_seconds or 0) // 60), key=f"ttl_{user_type}")
+            max_calls = cols[1].number_input(f"{user_type} no-shows (0 = never)", min_value=0, max_value=10,
+                                             value=int(policy.max_call_outs or 0), key=f"calls_{user_type}")
+            new_policies[user_type] = (ttl_min * 60 or None, max_calls or None)
+        if st.button("Update expiry policies", key="update_expiry"):
+            for user_type, (ttl, max_calls) in new_policies.items():
+                em.set_policy(user_type, ttl, max_calls)
+            fh.set_meta("expiry_policies", json.dumps(em.to_dict()))
+            st.success("Expiry policies updated.")
+
     st.caption("Admin actions affect everyone. Use undo to revert simple mistakes.")
 
 # Main area
@@ -166,67 +341,151 @@ st.header("Get a token")
 with st.form("register_form"):
     name = st.text_input("Your name")
     user_type = st.selectbox("Type", ["Normal", "VIP", "Emergency"])
+    line = st.selectbox("Service line", sl.line_names())
     submitted = st.form_submit_button("Get token")
     if submitted:
         if not name:
             st.error("Please enter your name.")
         else:
             if user_type == "Normal":
-                item = qm.enqueue(name, user_type)
+                item = sl.add_customer(name, user_type, line=line)
                 undo.push_operation('enqueue', {"token": item.token})
-                st.success(f"Token issued: {item.token} (Normal). Estimated wait: {qm.estimate_wait_time(item.token)['estimated_seconds']//60} minutes.")
+                with fh.batch():
+                    fh.add_queue_entry(item)
+                    fh.set_meta("next_token", qm.next_token)
+                    fh.push_undo('enqueue', {"token": item.token})
+                st.success(f"Token issued: {item.token} (Normal). Estimated wait: {sl.get_line(line)[0].estimate_wait_time(item.token)['estimated_seconds']//60} minutes.")
             else:
                 # priority add uses priority manager - choose priority_level mapping
                 mapping = {"VIP": 5, "Emergency": 10}
-                token = qm.next_token
-                qm.next_token += 1
-                pc = pm.add_priority_customer(token, name, mapping[user_type], user_type)
+                pc = sl.add_customer(name, user_type, line=line, priority_level=mapping[user_type])
                 undo.push_operation('enqueue', {"token": pc.token})
+                with fh.batch():
+                    fh.add_priority_entry(pc)
+                    fh.set_meta("next_token", qm.next_token)
+                    fh.push_undo('enqueue', {"token": pc.token})
                 st.success(f"Token issued: {pc.token} ({user_type}). You'll be prioritized.")
 
 # Visual board
 st.subheader("Queue Board")
 c1, c2 = st.columns([2,1])
 with c1:
-    st.markdown("### Priority Queue")
-    p_list = pm.peek_all()
-    if not p_list:
-        st.info("No priority customers.")
-    else:
-        dfp = pd.DataFrame(p_list)
-        st.table(dfp)
+    # rebuild the tables only when the change feed reports that a queue changed
+    board_key = (feed.version, tuple(sl.line_names()))
+    if st.session_state.get("board_key") != board_key:
+        st.session_state.board = {
+            line_name: (pd.DataFrame(lpm.peek_all()), pd.DataFrame(lqm.display_queue()))
+            for line_name, (lqm, lpm) in sl.lines.items()
+        }
+        st.session_state.board_key = board_key
+    for line_name, (dfp, dfq) in st.session_state.board.items():
+        suffix = f" — {line_name}" if len(sl.lines) > 1 else ""
+        st.markdown(f"### Priority Queue{suffix}")
+        if dfp.empty:
+            st.info("No priority customers.")
+        else:
+            st.table(dfp)
 
-    st.markdown("### Normal Queue")
-    q_list = qm.display_queue()
-    if not q_list:
-        st.info("No customers in queue.")
-    else:
-        dfq = pd.DataFrame(q_list)
-        st.table(dfq)
+        st.markdown(f"### Normal Queue{suffix}")
+        if dfq.empty:
+            st.info("No customers in queue.")
+        else:
+            st.table(dfq)
 
 with c2:
     st.markdown("### Counters")
-    st.markdown("Available: " + (", ".join(sm.available_counters()) if sm.available_counters() else "None"))
+    st.markdown("Available: " + (", ".join(counter_label(c) for c in sm.available_counters()) if sm.available_counters() else "None"))
     st.markdown("---")
-    est = qm.estimate_wait_time()
-    st.metric("Total waiting (people)", len(qm.queue))
-    st.metric("Estimated total wait (minutes)", f"{est['estimated_seconds']//60}")
+    est_seconds = sum(lqm.estimate_wait_time()["estimated_seconds"] for lqm, _ in sl.lines.values())
+    st.metric("Total waiting (people)", sum(len(lqm.queue) for lqm, _ in sl.lines.values()))
+    st.metric("Estimated total wait (minutes)", f"{est_seconds//60}")
 
 # Search by token
 st.subheader("Find your token")
 colx, coly = st.columns([2,1])
 token_search = colx.text_input("Enter your token to find position")
+
+def watch_container(key):
+    """
+    Register the watched token's container with the feed, so priority ranks are published
+    for it (key = (line, queue), or None to stop watching).
+    """
+    old = st.session_state.get("watch_key")
+    if old == key:
+        return
+    if old is not None:
+        feed.unwatch(*old)
+    if key is not None:
+        feed.watch(*key)
+    st.session_state.watch_key = key
+
+def locate_token(t):
+    """Full lookup of a token. Returns a watch dict for the change feed and a status message, or None."""
+    line = sl.locate(t)
+    lqm, lpm = sl.get_line(line) if line else (qm, pm)
+    # register before reading the position so no later change is published without one
+    watch_container((line, "normal" if t in lqm.token_map else "priority") if line else None)
+    loc, ttype, pos, est_sec = us.find_user_by_token(t, lqm.token_map, lpm.token_map, queue_manager=lqm,
+                                                     priority_manager=lpm)
+    if loc == "not_found":
+        return None
+    watch = {"token": t, "line": line, "queue": loc, "position": pos, "type": ttype}
+    return watch, watch_message(watch)
+
+def watch_message(w):
+    lqm = sl.get_line(w["line"])[0] if w["line"] in sl.lines else qm
+    est_sec = (w["position"] - 1) * lqm.avg_service_time
+    return f"Found in {w['queue']} ({w['line']}). Type: {w['type']}. Position: {w['position']}. Estimated wait: {int(est_sec)//60} minutes."
+
 if coly.button("Find"):
     try:
-        t = int(token_search)
-        loc, ttype, pos, est_sec = us.find_user_by_token(t, qm.token_map, pm.token_map, queue_manager=qm)
-        if loc == "not_found":
+        found = locate_token(int(token_search))
+        if found is None:
+            st.session_state.pop("watch", None)
             st.warning("Token not found.")
         else:
-            st.success(f"Found in {loc}. Type: {ttype}. Position: {pos}. Estimated wait: {int(est_sec)//60} minutes.")
+            st.session_state.watch, st.session_state.watch_msg = found
+            st.session_state.watch_version = feed.version
     except ValueError:
         st.error("Provide a numeric token.")
 
+def token_status():
+    """
+    Show the watched token. Only events published since the last check are applied,
+    so the position is recomputed only when it actually moved.
+    """
+    watch = st.session_state.get("watch")
+    if watch is None:
+        return
+    if watch["position"] is not None:
+        version, events = feed.events_since(st.session_state.watch_version)
+        st.session_state.watch_version = version
+        status = "resync" if events is None else ChangeFeed.apply(watch, events)
+        if status == "resync":
+            found = locate_token(watch["token"])
+            if found is None:
+                watch["position"] = None
+                status = "left"
+            else:
+                st.session_state.watch, st.session_state.watch_msg = found
+        elif status == "moved":
+            # an undo or no-show may have put the token back in another container
+            watch_container((watch["line"], watch["queue"]))
+            st.session_state.watch_msg = watch_message(watch)
+        if status == "left":
+            watch_container(None)
+            st.session_state.watch_msg = f"Token {watch['token']} has been served or removed."
+    if watch["position"] is None:
+        st.info(st.session_state.watch_msg)
+    else:
+        st.success(st.session_state.watch_msg)
+
+# newer Streamlit versions can refresh just this panel on a timer; checking the feed is O(1) when idle
+_fragment = getattr(st, "fragment", None)
+if _fragment is not None:
+    token_status = _fragment(run_every=5)(token_status)
+token_status()
+
 # Analytics
 st.header("Analytics & Reports")
 st.markdown("Simple statistics and activity graph.")
@@ -234,15 +493,27 @@ colA, colB = st.columns([2,1])
 with colA:
     avg_wait_display = an.average_wait_time([])  # placeholder: you could store real waits
     st.metric("Average Wait (sample)", f"{avg_wait_display:.1f} sec")
-    # graph
-    img_data = an.generate_matplotlib_bar()
-    st.image(img_data, use_column_width=True)
+    # history queries run in the storage backend when it can, else from memory
+    hour_ago = time.time() - 3600
+    recent = fh.services_between(hour_ago, float("inf"))
+    served_last_hour = len(recent) if recent is not None else sum(1 for ts in an.served_timestamps if ts >= hour_ago)
+    st.metric("Served in the last hour", served_last_hour)
+    expiry = fh.expiry_counts() or an.expiry_counts()
+    st.metric("Expired tokens", expiry["total"],
+              help=", ".join(f"{reason}: {n}" for reason, n in expiry["by_reason"].items()) or None)
+    # graph (aggregated by the storage backend when it can, else from memory);
+    # the PNG is re-rendered only when the counts change
+    hourly = fh.services_per_hour() or an.hourly_counts()
+    if st.session_state.get("chart_key") != tuple(hourly):
+        st.session_state.chart_png = an.generate_matplotlib_bar(counts=hourly)
+        st.session_state.chart_key = tuple(hourly)
+    st.image(st.session_state.chart_png, use_column_width=True)
 with colB:
     st.text("ASCII Graph (services per hour):")
-    st.code(an.generate_ascii_graph())
+    st.code(an.generate_ascii_graph(counts=hourly))
 
 # Footnotes / instructions
 st.markdown("---")
-st.info("Instructions: Use the 'Get a token' form to register. Admins in the sidebar can serve, remove, undo, and manage counters. Save state to persist across sessions.")
+st.info("Instructions: Use the 'Get a token' form to register. Admins in the sidebar can serve, remove, undo, and manage service lines and counters. Save state to persist across sessions.")
 
 # Save state on exit / periodically if desired (button already provided)
@@ -0,0 +1,150 @@
+# change_feed.py
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+class ChangeFeed:
+    """
+    Versioned feed of queue position changes, published by QueueManager and
+    PriorityManager so clients can wait for changes instead of polling.
+
+    Each event describes one token joining or leaving a container (the normal or
+    priority queue of a service line):
+      {"version", "line", "queue": 'normal'|'priority', "kind": 'join'|'leave'|'reset',
+       "token", "position"}
+    Other tokens in the same container shift implicitly: after a 'leave' at
+    position p everyone behind p moves up by one, after a 'join' at position p
+    everyone at p or behind moves back by one. One event therefore covers every
+    affected token, and a watcher applies it to its own position in O(1).
+    A 'reset' (bulk load) invalidates all positions in that container.
+
+    Positions are cheap in a normal queue (a deque index) but cost O(n) in a priority
+    heap. Publishers therefore ask is_watched() first and may publish position None
+    when nobody watches the container. Watchers register with watch() before reading
+    their starting position. A None position in a watched container still makes the
+    watcher resync, so a late registration cannot produce a wrong position.
+
+    Only the last max_events events are kept; a client that falls further behind
+    is told to resync.
+    """
+
+    def __init__(self, max_events: int = 1000):
+        self.version = 0
+        self.events = deque(maxlen=max_events)
+        self._cond = threading.Condition()
+        self._watchers: Dict[Tuple[str, str], int] = {}  # (line, queue) -> number of watchers
+
+    def watch(self, line: str, queue: str):
+        """Register interest in positions of one container (see is_watched)."""
+        with self._cond:
+            self._watchers[(line, queue)] = self._watchers.get((line, queue), 0) + 1
+
+    def unwatch(self, line: str, queue: str):
+        with self._cond:
+            count = self._watchers.get((line, queue), 0) - 1
+            if count > 0:
+                self._watchers[(line, queue)] = count
+            else:
+                self._watchers.pop((line, queue), None)
+
+    def is_watched(self, line: str, queue: str) -> bool:
+        """True if some client tracks positions in this container."""
+        return (line, queue) in self._watchers
+
+    def publish(self, line: str, queue: str, kind: str, token: Optional[int] = None,
+                position: Optional[int] = None) -> int:
+        """Append an event and wake waiting clients. Returns the new version."""
+        with self._cond:
+            self.version += 1
+            self.events.append({"version": self.version, "line": line, "queue": queue, "kind": kind,
+                                "token": token, "position": position})
+            self._cond.notify_all()
+            return self.version
+
+    def events_since(self, version: int) -> Tuple[int, Optional[List[Dict]]]:
+        """
+        Return (current_version, events newer than version).
+        Events is None if some of them were already discarded (client must resync).
+        """
+        with self._cond:
+            if version >= self.version:
+                return self.version, []
+            if not self.events or self.events[0]["version"] > version + 1:
+                return self.version, None
+            # events are contiguous by version, so slice from the right offset
+            start = version + 1 - self.events[0]["version"]
+            return self.version, [self.events[i] for i in range(start, len(self.events))]
+
+    def wait(self, since_version: int, timeout: Optional[float] = None) -> int:
+        """Long-poll: block until the version exceeds since_version or timeout. Returns the current version."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version > since_version, timeout)
+            return self.version
+
+    @staticmethod
+    def apply(watch: Dict, events: List[Dict]) -> str:
+        """
+        Apply events to a watch {"token", "line", "queue", "position"} in place.
+        Returns 'unchanged', 'moved', 'left' (token was served/removed) or 'resync'.
+        """
+        status = "unchanged"
+        for ev in events:
+            if ev["token"] == watch["token"]:
+                if ev["kind"] == "leave":
+                    watch["position"] = None
+                    status = "left"
+                    continue
+                if ev["kind"] == "join" and ev["position"] is None:
+                    return "resync"
+                if ev["kind"] == "join":
+                    # e.g. an undo put the token back, possibly in another container
+                    watch.update(line=ev["line"], queue=ev["queue"], position=ev["position"])
+                    status = "moved"
+                    continue
+            if watch["position"] is None or ev["line"] != watch["line"] or ev["queue"] != watch["queue"]:
+                continue
+            if ev["kind"] == "reset" or ev["position"] is None:
+                return "resync"
+            if ev["kind"] == "leave" and ev["position"] < watch["position"]:
+                watch["position"] -= 1
+                status = "moved"
+            elif ev["kind"] == "join" and ev["position"] <= watch["position"]:
+                watch["position"] += 1
+                status = "moved"
+        return status
+
+    def track(self, watch: Dict, since_version: int, timeout: Optional[float] = None) -> Tuple[int, str]:
+        """
+        Long-poll for one token: block until its position moves, it leaves, a resync is needed
+        or timeout expires. Updates watch in place and returns (version, status).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        version = since_version
+        while True:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            current = self.wait(version, remaining)
+            if current == version:
+                return version, "unchanged"  # timed out
+            version, events = self.events_since(version)
+            if events is None:
+                return version, "resync"
+            status = self.apply(watch, events)
+            if status != "unchanged":
+                return version, status
+
+    async def subscribe(self, watch: Dict, since_version: int, poll_timeout: float = 30.0):
+        """
+        Async iterator of (version, status) for one token; ends after 'left' or 'resync'.
+        Each long-poll runs in the default executor so the event loop is not blocked.
+        """
+        loop = asyncio.get_event_loop()
+        version = since_version
+        while True:
+            version, status = await loop.run_in_executor(None, self.track, watch, version, poll_timeout)
+            if status == "unchanged":
+                continue
+            yield version, status
+            if status in ("left", "resync"):
+                return
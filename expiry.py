@@ -0,0 +1,241 @@
+# expiry.py
+import heapq
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from queue_manager import QueueItem
+
+class ExpiryPolicy:
+    """
+    Expiry settings for one user type.
+    ttl_seconds: a token expires this long after it was issued (None = never).
+    max_call_outs: after this many no-shows the token expires; before that a no-show
+    only skips the customer behind the others (None = always skip, see ExpiryManager.no_show).
+    """
+    def __init__(self, ttl_seconds: Optional[float] = None, max_call_outs: Optional[int] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_call_outs = max_call_outs
+
+    def to_dict(self) -> Dict:
+        return {"ttl_seconds": self.ttl_seconds, "max_call_outs": self.max_call_outs}
+
+class ExpiryManager:
+    """
+    Expires stale and no-show tokens across all service lines without scanning the queues.
+
+    Deadlines are kept per user type. The TTL is the same for every token of a type and
+    tokens are issued in time order, so deadlines arrive already sorted and a FIFO deque
+    per type works as the deadline queue: O(1) to add, O(1) to pop. Tokens that come back
+    out of order (undo, restore) go into a small heap instead.
+    New tokens are picked up from the ChangeFeed 'join' events. Tokens that are served or
+    removed are not looked up: their entries are dropped when they reach the head of the
+    deque. Each token is therefore pushed and popped once, O(1) amortised.
+
+    Expired tokens are removed from their queues and returned as entries
+    {"item", "container", "reason", "expired_at"} for analytics; restore() puts them back.
+    """
+    USER_TYPES = ("Normal", "VIP", "Emergency")
+
+    def __init__(self, service_lines, feed, policies: Optional[Dict[str, ExpiryPolicy]] = None):
+        self.service_lines = service_lines
+        self.feed = feed
+        self.policies: Dict[str, ExpiryPolicy] = {t: ExpiryPolicy() for t in self.USER_TYPES}
+        self.policies.update(policies or {})
+        self.call_outs: Dict[int, int] = {}  # token -> number of no-shows so far
+        # token -> time it was restored; its TTL runs from then instead of the issue time
+        self.restored_at: Dict[int, float] = {}
+        self.rebuild()
+
+    # -------------------------
+    # Configuration
+    # -------------------------
+    def set_policy(self, user_type: str, ttl_seconds: Optional[float] = None, max_call_outs: Optional[int] = None):
+        """Change the policy for a user type. Deadlines are recomputed (O(n), configuration only)."""
+        self.policies[user_type] = ExpiryPolicy(ttl_seconds, max_call_outs)
+        self.rebuild()
+
+    def to_dict(self) -> Dict:
+        return {"policies": {t: p.to_dict() for t, p in self.policies.items()},
+                "restored_at": {str(t): at for t, at in self.restored_at.items()}}
+
+    def load_from_dict(self, data: Dict):
+        for user_type, d in data.get("policies", {}).items():
+            self.policies[user_type] = ExpiryPolicy(d.get("ttl_seconds"), d.get("max_call_outs"))
+        self.restored_at = {int(t): at for t, at in data.get("restored_at", {}).items()}
+        self.rebuild()
+
+    # -------------------------
+    # Deadline tracking
+    # -------------------------
+    def rebuild(self):
+        """
+        Recompute all deadlines from the queues. Used after policy changes, bulk loads and when
+        the change feed was trimmed. Restored tokens keep the TTL that started at their restore.
+        """
+        self._due: Dict[str, deque] = {}  # user type -> deque of (deadline, token), sorted
+        self._late = []  # heap of (deadline, token) added out of order
+        self.deadlines: Dict[int, float] = {}  # token -> current deadline
+        self._version = self.feed.version
+        items = []
+        for qm, pm in self.service_lines.lines.values():
+            items.extend(qm.token_map.values())
+            items.extend(pm.token_map.values())
+        waiting = {item.token for item in items}
+        self.restored_at = {t: at for t, at in self.restored_at.items() if t in waiting}
+        for item in sorted(items, key=self._start):
+            self._track(item)
+
+    def _start(self, item) -> float:
+        """When a token's TTL started: its restore time if it was restored, else its issue time."""
+        return self.restored_at.get(item.token, item.timestamp)
+
+    def _track(self, item):
+        """Register a token's deadline (start of its TTL + TTL of its type)."""
+        policy = self.policies.get(item.type)
+        if policy is None or policy.ttl_seconds is None:
+            return
+        deadline = self._start(item) + policy.ttl_seconds
+        self.deadlines[item.token] = deadline
+        due = self._due.setdefault(item.type, deque())
+        if due and deadline < due[-1][0]:
+            heapq.heappush(self._late, (deadline, item.token))
+        else:
+            due.append((deadline, item.token))
+
+    def _sync(self):
+        """Track tokens that joined a queue since the last call (read from the change feed)."""
+        version, events = self.feed.events_since(self._version)
+        if events is None:
+            self.rebuild()
+            return
+        self._version = version
+        for ev in events:
+            if ev["kind"] == "reset":
+                self.rebuild()
+                return
+            if ev["kind"] == "join" and ev["token"] not in self.deadlines:
+                item = self._find(ev["token"])
+                if item is not None:
+                    self._track(item)
+
+    def _find(self, token: int):
+        line = self.service_lines.locate(token)
+        if line is None:
+            return None
+        qm, pm = self.service_lines.get_line(line)
+        return qm.token_map.get(token) or pm.token_map.get(token)
+
+    def next_deadline(self) -> Optional[float]:
+        """Earliest pending deadline (may belong to an already served token), or None."""
+        heads = [d[0][0] for d in self._due.values() if d]
+        if self._late:
+            heads.append(self._late[0][0])
+        return min(heads) if heads else None
+
+    # -------------------------
+    # Expiry
+    # -------------------------
+    def expire(self, now: Optional[float] = None) -> List[Dict]:
+        """
+        Remove every token whose deadline has passed. Only due entries are touched.
+        Returns the expired entries (oldest deadline first).
+        """
+        now = time.time() if now is None else now
+        self._sync()
+        due_tokens = []
+        for due in self._due.values():
+            while due and due[0][0] <= now:
+                due_tokens.append(due.popleft())
+        while self._late and self._late[0][0] <= now:
+            due_tokens.append(heapq.heappop(self._late))
+        due_tokens.sort()
+
+        # keep only entries that still describe a waiting token (lazy deletion)
+        by_line: Dict[str, Dict[str, list]] = {}
+        for deadline, token in due_tokens:
+            if self.deadlines.get(token) != deadline:
+                continue
+            del self.deadlines[token]
+            self.restored_at.pop(token, None)
+            line = self.service_lines.locate(token)
+            if line is None:
+                continue
+            qm, _ = self.service_lines.get_line(line)
+            container = "normal" if token in qm.token_map else "priority"
+            by_line.setdefault(line, {"normal": [], "priority": []})[container].append(token)
+
+        expired = []
+        for line, tokens in by_line.items():
+            qm, pm = self.service_lines.get_line(line)
+            # expired normal tokens sit near the head (old) or the tail (requeued); removal searches both ends
+            removed = [(qm.find_and_remove(t), "normal") for t in tokens["normal"]]
+            removed += [(pc, "priority") for pc in pm.remove_tokens(tokens["priority"])]
+            for item, container in removed:
+                self.call_outs.pop(item.token, None)
+                expired.append(self._entry(item, container, "ttl", now))
+            self.service_lines.touch(line)
+        self._version = self.feed.version  # our own removals need no tracking
+        return expired
+
+    @staticmethod
+    def _entry(item, container: str, reason: str, expired_at: float) -> Dict:
+        return {"item": item.to_dict(), "container": container, "reason": reason, "expired_at": expired_at}
+
+    def no_show(self, item, container: str, now: Optional[float] = None) -> Dict:
+        """
+        A called customer did not come to the counter. item has already left its queue.
+        Below the type's max_call_outs the customer is skipped: a normal token goes to the back
+        of its queue, a priority token directly behind the customer now at the top, keeping its
+        level (PriorityManager.skip), so the next customer is served first. At the limit the token expires.
+        Returns {"action": 'skipped', "call_outs": n} or {"action": 'expired', "entry": {...}};
+        {"action": 'waiting'} and no change if the token is still in a queue (e.g. its serve was undone).
+        """
+        if self.service_lines.locate(item.token) is not None:
+            return {"action": "waiting"}
+        now = time.time() if now is None else now
+        count = self.call_outs.get(item.token, 0) + 1
+        policy = self.policies.get(item.type, ExpiryPolicy())
+        if policy.max_call_outs is not None and count >= policy.max_call_outs:
+            self.call_outs.pop(item.token, None)
+            self.deadlines.pop(item.token, None)
+            self.restored_at.pop(item.token, None)
+            return {"action": "expired", "entry": self._entry(item, container, "no_show", now)}
+        self.call_outs[item.token] = count
+        qm, pm = self.service_lines.get_line(item.line)
+        if container == "normal":
+            qm.requeue(item)
+        else:
+            pm.skip(item)
+        self.service_lines.touch(item.line)
+        return {"action": "skipped", "call_outs": count}
+
+    def restore(self, entries: List[Dict], now: Optional[float] = None) -> List[int]:
+        """
+        Revert an expiry: put the tokens back, keeping their issue time, and give them a fresh
+        TTL from now (recorded in restored_at so rebuild() keeps it; persist via to_dict()).
+        Normal tokens return to the head of their queue in issue order (where old tokens were),
+        so they are pushed newest first; priority tokens rejoin their level oldest first to keep
+        FIFO order among equal levels.
+        Returns the restored tokens.
+        """
+        now = time.time() if now is None else now
+        restored = []
+        by_age = sorted(entries, key=lambda e: e["item"]["timestamp"])
+        normal = [e for e in reversed(by_age) if e["container"] == "normal"]
+        priority = [e for e in by_age if e["container"] != "normal"]
+        for entry in normal + priority:
+            d = entry["item"]
+            line = d.get("line", self.service_lines.default_line)
+            qm, pm = self.service_lines.add_line(line)
+            if entry["container"] == "normal":
+                item = QueueItem(d["token"], d["name"], d["type"], d["timestamp"], line)
+                qm.requeue(item, front=True)
+            else:
+                item = pm.add_priority_customer(d["token"], d["name"], d["priority_level"], d["type"],
+                                                d["timestamp"])
+            self.restored_at[item.token] = now
+            self._track(item)
+            self.service_lines.touch(line)
+            restored.append(item.token)
+        return restored
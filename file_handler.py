@@ -3,16 +3,21 @@ import json
 from typing import Dict
 from pathlib import Path
 
-class FileHandler:
+from storage_backend import StorageBackend
+
+class FileHandler(StorageBackend):
     """
     Save and load the queue system state to/from a JSON file.
     Each manager must provide to_dict() and load_from_dict() methods.
+    This is a snapshot-only backend: incremental hooks are no-ops and the
+    whole document is rewritten on every save (see SQLiteBackend for row-level writes).
     """
 
     def __init__(self, filename: str = "smartqueue_state.json"):
         self.filename = Path(filename)
 
-    def save_to_file(self, queue_manager, priority_manager, service_manager, analytics, undo_stack=None):
+    def save_to_file(self, queue_manager, priority_manager, service_manager, analytics, undo_stack=None,
+                     service_lines=None, expiry_manager=None):
         """
         Persist current queue state.
         """
@@ -20,14 +25,20 @@ class FileHandler:
             "queue_manager": queue_manager.to_dict(),
             "priority_manager": priority_manager.to_dict(),
             "service_manager": service_manager.to_dict(),
-            "analytics": {"served_timestamps": getattr(analytics, "served_timestamps", [])},
+            "analytics": {"served_timestamps": getattr(analytics, "served_timestamps", []),
+                          "expired_entries": getattr(analytics, "expired_entries", [])},
             "undo_stack": getattr(undo_stack, "stack", [])
         }
+        if service_lines is not None:
+            state["service_lines"] = service_lines.to_dict()
+        if expiry_manager is not None:
+            state["expiry"] = expiry_manager.to_dict()
         with open(self.filename, "w") as f:
             json.dump(state, f, indent=2)
         return str(self.filename.resolve())
 
-    def load_from_file(self, queue_manager, priority_manager, service_manager, analytics, undo_stack=None):
+    def load_from_file(self, queue_manager, priority_manager, service_manager, analytics, undo_stack=None,
+                       service_lines=None, expiry_manager=None):
         """
         Restore queue state from file. Returns True if loaded, False if file missing.
         """
@@ -39,6 +50,11 @@ class FileHandler:
         priority_manager.load_from_dict(state.get("priority_manager", {}))
         service_manager.load_from_dict(state.get("service_manager", {}))
         analytics.served_timestamps = state.get("analytics", {}).get("served_timestamps", [])
+        analytics.expired_entries = state.get("analytics", {}).get("expired_entries", [])
         if undo_stack is not None:
             undo_stack.stack = state.get("undo_stack", [])
+        if service_lines is not None:
+            service_lines.load_from_dict(state.get("service_lines", {}))
+        if expiry_manager is not None:
+            expiry_manager.load_from_dict(state.get("expiry", {}))
         return True
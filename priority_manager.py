@@ -1,19 +1,23 @@
 # priority_manager.py
 import heapq
+import math
 import time
 from typing import Tuple, Optional, List, Dict
 
+from queue_manager import DEFAULT_LINE
+
 class PriorityCustomer:
     """
     Data for priority queue customers.
     Higher priority_level means served earlier; we'll invert for heapq (min-heap).
     """
-    def __init__(self, token:int, name:str, priority_level:int, timestamp:float, user_type:str):
+    def __init__(self, token:int, name:str, priority_level:int, timestamp:float, user_type:str, line:str=DEFAULT_LINE):
         self.token = token
         self.name = name
         self.priority_level = priority_level
         self.timestamp = timestamp
         self.type = user_type  # 'VIP' or 'Emergency'
+        self.line = line  # service line the customer is waiting in
 
     def to_dict(self) -> Dict:
         return {
@@ -21,29 +25,68 @@ class PriorityCustomer:
             "name": self.name,
             "priority_level": self.priority_level,
             "timestamp": self.timestamp,
-            "type": self.type
+            "type": self.type,
+            "line": self.line
         }
 
 class PriorityManager:
     """
     Handles priority customers using heapq. Priority levels: larger -> higher priority.
+    Each service line has its own PriorityManager; `line` names it.
+    If a ChangeFeed is given, every position change is published to it. A heap rank
+    costs an O(n) count, so it is only computed while the feed has a watcher for this
+    line's priority queue; otherwise events carry position None and cost nothing extra.
+    Removals other than serving are lazy: the customer leaves token_map and its heap entry
+    becomes dead (see _live). Dead entries are dropped when they reach the top, so heap[0]
+    is always a waiting customer, and the heap is compacted once they outnumber the live ones.
     """
-    def __init__(self):
+    def __init__(self, line:str=DEFAULT_LINE, feed=None):
+        self.line = line
+        self.feed = feed
         self.heap = []  # stores tuples (priority_sort_key, count, PriorityCustomer)
         self._counter = 0  # tie-breaker to preserve FIFO for equal priority
         self.token_map = {}  # token -> PriorityCustomer
 
-    def add_priority_customer(self, token:int, name:str, priority_level:int, user_type:str) -> PriorityCustomer:
+    def _publish(self, kind:str, token:Optional[int]=None, position:Optional[int]=None):
+        if self.feed is not None:
+            self.feed.publish(self.line, "priority", kind, token, position)
+
+    def _watched(self) -> bool:
+        return self.feed is not None and self.feed.is_watched(self.line, "priority")
+
+    def _live(self, entry) -> bool:
+        return self.token_map.get(entry[2].token) is entry[2]
+
+    def _drop_dead_top(self):
+        """Pop removed entries off the top and compact the heap if it is mostly dead."""
+        while self.heap and not self._live(self.heap[0]):
+            heapq.heappop(self.heap)
+        if len(self.heap) > 2 * len(self.token_map) + 16:
+            self.heap = [t for t in self.heap if self._live(t)]
+            heapq.heapify(self.heap)
+
+    def _rank(self, entry) -> int:
+        """1-based serving position of a heap entry (O(n) count of live entries ahead of it)."""
+        key = entry[:2]
+        return 1 + sum(1 for t in self.heap if t[:2] < key and self._live(t))
+
+    def add_priority_customer(self, token:int, name:str, priority_level:int, user_type:str,
+                              timestamp:Optional[float]=None) -> PriorityCustomer:
         """
         Add VIP or emergency customers.
         priority_level: integer (e.g., 1 normal, 5 VIP, 10 emergency). Larger -> higher priority.
+        timestamp: original issue time when a customer is put back (default now).
         Returns PriorityCustomer.
         """
         self._counter += 1
-        pc = PriorityCustomer(token, name, priority_level, time.time(), user_type)
+        pc = PriorityCustomer(token, name, priority_level, time.time() if timestamp is None else timestamp,
+                              user_type, self.line)
         # Use negative priority_level so highest gets smallest -priority_level (min-heap).
-        heapq.heappush(self.heap, (-priority_level, self._counter, pc))
+        entry = (-priority_level, self._counter, pc)
+        heapq.heappush(self.heap, entry)
         self.token_map[token] = pc
+        if self.feed is not None:
+            self._publish("join", token, self._rank(entry) if self._watched() else None)
         return pc
 
     def get_next_priority_customer(self) -> Optional[PriorityCustomer]:
@@ -54,31 +97,91 @@ class PriorityManager:
             return None
         _, _, pc = heapq.heappop(self.heap)
         self.token_map.pop(pc.token, None)
+        self._drop_dead_top()
+        self._publish("leave", pc.token, 1)
         return pc
 
+    def skip(self, pc:PriorityCustomer) -> PriorityCustomer:
+        """
+        Re-add a called customer who did not show up directly behind the customer now at the
+        top, keeping their priority_level: the entry gets a sort key between the top entry and
+        the one after it. With nobody else waiting they are simply next again.
+        The skip only orders the live heap; a saved snapshot orders customers by level again.
+        Returns the re-added PriorityCustomer.
+        """
+        if not self.heap:
+            return self.add_priority_customer(pc.token, pc.name, pc.priority_level, pc.type, pc.timestamp)
+        top = heapq.heappop(self.heap)
+        self._drop_dead_top()
+        if self.heap and self.heap[0][0] == top[0]:
+            # midway to the next entry of the same level; no entry can hold that key already
+            key = (top[0], (top[1] + self.heap[0][1]) / 2)
+        else:
+            # nobody else at the top level: ahead of anyone joining it later (integer counters)
+            key = (top[0], (top[1] + math.floor(top[1]) + 1) / 2)
+        heapq.heappush(self.heap, top)
+        skipped = PriorityCustomer(pc.token, pc.name, pc.priority_level, pc.timestamp, pc.type, self.line)
+        heapq.heappush(self.heap, key + (skipped,))
+        self.token_map[pc.token] = skipped
+        self._publish("join", pc.token, 2)
+        return skipped
+
     def peek_all(self) -> List[Dict]:
         """
         Return list representation of all priority customers (sorted by priority and insertion).
         """
-        items = sorted(self.heap, reverse=False)  # since stored as (-priority, counter,...)
+        items = sorted(t for t in self.heap if self._live(t))  # since stored as (-priority, counter,...)
         return [tup[2].to_dict() for tup in items]
 
     def remove_by_token(self, token:int):
         """
-        Lazy removal: mark removed by popping until found; rebuild heap if needed.
-        Simpler approach: rebuild heap without the token.
+        Lazy removal: drop the token from token_map; its heap entry is discarded
+        once it reaches the top (amortised O(log n)).
         """
         if token not in self.token_map:
             return None
+        position = None
+        if self.heap[0][2].token == token:
+            position = 1
+        elif self._watched():
+            position = self.get_position(token)
         removed = self.token_map.pop(token)
-        # rebuild heap without token
-        self.heap = [t for t in self.heap if t[2].token != token]
-        heapq.heapify(self.heap)
+        self._drop_dead_top()
+        self._publish("leave", token, position)
+        return removed
+
+    def remove_tokens(self, tokens) -> List[PriorityCustomer]:
+        """
+        Remove several tokens at once (used by expiry), lazily as in remove_by_token.
+        Leave events carry position 1 for tokens removed from the top and None otherwise
+        (watchers of this queue resync), so no ranks are computed.
+        Returns the removed customers.
+        """
+        removed = []
+        for token in tokens:
+            pc = self.token_map.get(token)
+            if pc is None:
+                continue
+            at_top = self.heap[0][2] is pc
+            del self.token_map[token]
+            self._drop_dead_top()
+            self._publish("leave", token, 1 if at_top else None)
+            removed.append(pc)
         return removed
 
+    def get_position(self, token:int) -> int:
+        """
+        Return the 1-based serving position of token among priority customers, or -1 if absent.
+        """
+        pc = self.token_map.get(token)
+        for entry in self.heap:
+            if entry[2] is pc:
+                return self._rank(entry)
+        return -1
+
     def to_dict(self) -> Dict:
         return {
-            "heap": [tup[2].to_dict() for tup in sorted(self.heap, reverse=False)],
+            "heap": self.peek_all(),
             "counter": self._counter
         }
 
@@ -87,7 +190,8 @@ class PriorityManager:
         self.token_map = {}
         self._counter = data.get("counter", 0)
         for i, d in enumerate(data.get("heap", [])):
-            pc = PriorityCustomer(d['token'], d['name'], d['priority_level'], d['timestamp'], d.get('type','VIP'))
+            pc = PriorityCustomer(d['token'], d['name'], d['priority_level'], d['timestamp'], d.get('type','VIP'), self.line)
             self._counter += 1
             heapq.heappush(self.heap, (-pc.priority_level, self._counter, pc))
             self.token_map[pc.token] = pc
+        self._publish("reset")
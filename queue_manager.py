@@ -3,22 +3,27 @@ from collections import deque
 import time
 from typing import List, Dict, Optional
 
+# Name of the service line used when none is specified (see service_lines.py)
+DEFAULT_LINE = "General"
+
 class QueueItem:
     """
     Represents a user in the queue.
     """
-    def __init__(self, token: int, name: str, user_type: str, timestamp: float):
+    def __init__(self, token: int, name: str, user_type: str, timestamp: float, line: str = DEFAULT_LINE):
         self.token = token
         self.name = name
         self.type = user_type  # 'Normal', 'VIP', 'Emergency'
         self.timestamp = timestamp  # time when token was issued
+        self.line = line  # service line the customer is waiting in
 
     def to_dict(self) -> Dict:
         return {
             "token": self.token,
             "name": self.name,
             "type": self.type,
-            "timestamp": self.timestamp
+            "timestamp": self.timestamp,
+            "line": self.line
         }
 
 class QueueManager:
@@ -26,27 +31,50 @@ class QueueManager:
     Manages the main queue (for Normal customers). Priority customers are handled
     by priority_manager but integrate through this manager.
     Uses deque for O(1) enqueue/dequeue.
+    Each service line has its own QueueManager; `line` names it.
+    If a ChangeFeed is given, every position change is published to it.
     """
-    def __init__(self, avg_service_time_seconds: int = 180):
+    def __init__(self, avg_service_time_seconds: int = 180, line: str = DEFAULT_LINE, feed=None):
+        self.line = line
+        self.feed = feed
         self.queue = deque()  # holds QueueItem for normal flow
         self.next_token = 1
         self.avg_service_time = max(1, avg_service_time_seconds)  # seconds per service (default 3 minutes)
         # mapping token -> QueueItem for quick lookup
         self.token_map = {}
 
-    def enqueue(self, name: str, user_type: str='Normal') -> QueueItem:
+    def _publish(self, kind: str, token: Optional[int] = None, position: Optional[int] = None):
+        if self.feed is not None:
+            self.feed.publish(self.line, "normal", kind, token, position)
+
+    def enqueue(self, name: str, user_type: str='Normal', token: Optional[int] = None) -> QueueItem:
         """
         Add user to queue with token and priority type.
         For Normal users this manager stores them; for others, priority_manager should be used.
+        token: use a token issued elsewhere (shared numbering across service lines)
+        instead of this manager's next_token.
         Returns QueueItem.
         """
-        token = self.next_token
-        self.next_token += 1
-        item = QueueItem(token, name, user_type, time.time())
+        if token is None:
+            token = self.next_token
+            self.next_token += 1
+        item = QueueItem(token, name, user_type, time.time(), self.line)
         self.queue.append(item)
         self.token_map[token] = item
+        self._publish("join", token, len(self.queue))
         return item
 
+    def requeue(self, item: QueueItem, front: bool = False):
+        """
+        Put an existing QueueItem back in the queue (used by undo), at the head if front=True.
+        """
+        if front:
+            self.queue.appendleft(item)
+        else:
+            self.queue.append(item)
+        self.token_map[item.token] = item
+        self._publish("join", item.token, 1 if front else len(self.queue))
+
     def dequeue(self) -> Optional[QueueItem]:
         """
         Serve the next customer from the normal queue. Returns the QueueItem or None if empty.
@@ -55,6 +83,7 @@ class QueueManager:
             return None
         item = self.queue.popleft()
         self.token_map.pop(item.token, None)
+        self._publish("leave", item.token, 1)
         return item
 
     def display_queue(self) -> List[Dict]:
@@ -86,17 +115,23 @@ class QueueManager:
     def find_and_remove(self, token: int) -> Optional[QueueItem]:
         """
         Remove a user by token from the normal queue. Returns the removed item or None.
+        The queue is searched from both ends at once, so removing a token near the head
+        (old tokens) or the tail (requeued ones) costs O(distance to the nearer end).
         """
-        for idx, item in enumerate(self.queue):
-            if item.token == token:
-                removed = self.queue[idx]
-                # remove by reconstructing deque without that index for simplicity
-                self.queue.rotate(-idx)
-                self.queue.popleft()
-                self.queue.rotate(idx)
-                self.token_map.pop(token, None)
-                return removed
-        return None
+        if token not in self.token_map:
+            return None
+        last = len(self.queue) - 1
+        for (idx, front), back in zip(enumerate(self.queue), reversed(self.queue)):
+            if front.token == token:
+                removed = front
+                break
+            if back.token == token:
+                removed, idx = back, last - idx
+                break
+        del self.queue[idx]  # deque deletion rotates from the nearer end
+        self.token_map.pop(token, None)
+        self._publish("leave", token, idx + 1)
+        return removed
 
     def to_dict(self) -> Dict:
         """
@@ -117,6 +152,7 @@ class QueueManager:
         self.queue = deque()
         self.token_map = {}
         for d in data.get("queue", []):
-            item = QueueItem(d['token'], d['name'], d['type'], d['timestamp'])
+            item = QueueItem(d['token'], d['name'], d['type'], d['timestamp'], self.line)
             self.queue.append(item)
             self.token_map[item.token] = item
+        self._publish("reset")
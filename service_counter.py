@@ -1,16 +1,24 @@
 # service_counter.py
-from typing import List, Optional
+from typing import Callable, Dict, List, Optional
 
 class ServiceCounterManager:
     """
     Manages available service counters as a stack.
     Push when a counter becomes free, pop to assign to a customer.
+    Counters can be tagged with the service lines they handle; an untagged
+    counter serves every line.
     """
     def __init__(self):
         self.available = []  # stack of counter ids
+        self.skills: Dict[str, List[str]] = {}  # counter id -> service lines it can serve
 
-    def push_counter(self, counter_id: str):
-        """Add an available service counter"""
+    def push_counter(self, counter_id: str, lines: Optional[List[str]] = None):
+        """
+        Add an available service counter.
+        lines: service lines the counter can serve (None keeps its current tags, or all lines).
+        """
+        if lines is not None:
+            self.skills[counter_id] = list(lines)
         if counter_id in self.available:
             return
         self.available.append(counter_id)
@@ -21,12 +29,27 @@ class ServiceCounterManager:
             return None
         return self.available.pop()
 
+    def pop_counter_where(self, predicate: Callable[[str], bool]) -> Optional[str]:
+        """
+        Pop the topmost counter for which predicate(counter_id) is true.
+        Used to skip counters that cannot serve any waiting line. Returns counter id or None.
+        """
+        for idx in range(len(self.available) - 1, -1, -1):
+            if predicate(self.available[idx]):
+                return self.available.pop(idx)
+        return None
+
+    def counter_lines(self, counter_id: str) -> Optional[List[str]]:
+        """Return the service lines a counter is tagged with, or None if it serves all lines."""
+        return self.skills.get(counter_id)
+
     def available_counters(self) -> List[str]:
         """Return a list of available counters (top of stack is last element)."""
         return list(self.available)
 
     def to_dict(self):
-        return {"available": list(self.available)}
+        return {"available": list(self.available), "skills": dict(self.skills)}
 
     def load_from_dict(self, data):
         self.available = list(data.get("available", []))
+        self.skills = {c: list(lines) for c, lines in data.get("skills", {}).items()}
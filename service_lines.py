@@ -0,0 +1,217 @@
+# service_lines.py
+import heapq
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from queue_manager import QueueManager
+from priority_manager import PriorityManager
+
+class ServiceLineManager:
+    """
+    Routes customers across several named service lines (e.g. 'General', 'Billing').
+    Each line has its own QueueManager for normal customers and PriorityManager for
+    VIP / Emergency customers. Tokens are issued by the default line's QueueManager
+    so they stay unique across lines.
+
+    Dispatching: for every counter skill set (the lines a counter can serve) a heap of
+    (line_key, line_name) is kept, so the best line for a free counter is found in
+    O(log L). Entries are invalidated lazily: an entry whose key no longer matches the
+    line's current key is dropped (and re-pushed with the fresh key if the line still
+    has customers).
+    Policies:
+      - 'oldest': line whose next customer has waited longest
+      - 'longest': line with the most waiting customers
+    Priority customers always win: a line with a waiting Emergency ranks above any line
+    whose best customer is VIP or Normal.
+    """
+    POLICIES = ("oldest", "longest")
+
+    def __init__(self, queue_manager: QueueManager, priority_manager: PriorityManager, policy: str = "oldest"):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown dispatch policy: {policy}")
+        self.default_line = queue_manager.line
+        self.lines: Dict[str, Tuple[QueueManager, PriorityManager]] = {
+            self.default_line: (queue_manager, priority_manager)
+        }
+        self.policy = policy
+        # skill set (None = every line) -> heap of (line_key, line_name)
+        self._heaps: Dict[Optional[FrozenSet[str]], list] = {}
+
+    # -------------------------
+    # Lines and customers
+    # -------------------------
+    def add_line(self, name: str) -> Tuple[QueueManager, PriorityManager]:
+        """Create a service line (no-op if it exists). Returns its (QueueManager, PriorityManager)."""
+        if name in self.lines:
+            return self.lines[name]
+        avg = self.lines[self.default_line][0].avg_service_time
+        feed = self.lines[self.default_line][0].feed
+        managers = (QueueManager(avg_service_time_seconds=avg, line=name, feed=feed),
+                    PriorityManager(line=name, feed=feed))
+        self.lines[name] = managers
+        return managers
+
+    def line_names(self) -> List[str]:
+        return list(self.lines)
+
+    def get_line(self, name: str) -> Tuple[QueueManager, PriorityManager]:
+        """Return (QueueManager, PriorityManager) of a line. Raises KeyError if unknown."""
+        return self.lines[name]
+
+    def issue_token(self) -> int:
+        """Reserve the next token number (shared by all lines)."""
+        token_source = self.lines[self.default_line][0]
+        token = token_source.next_token
+        token_source.next_token += 1
+        return token
+
+    def add_customer(self, name: str, user_type: str = "Normal", line: Optional[str] = None,
+                     priority_level: Optional[int] = None):
+        """
+        Issue a token and add the customer to a line.
+        priority_level: None for normal customers, else the PriorityManager level (e.g. 5 VIP, 10 Emergency).
+        Returns the QueueItem or PriorityCustomer.
+        """
+        line = line or self.default_line
+        qm, pm = self.lines[line]
+        token = self.issue_token()
+        if priority_level is None:
+            item = qm.enqueue(name, user_type, token=token)
+        else:
+            item = pm.add_priority_customer(token, name, priority_level, user_type)
+        self.touch(line)
+        return item
+
+    def locate(self, token: int) -> Optional[str]:
+        """Return the name of the line holding token, or None."""
+        for name, (qm, pm) in self.lines.items():
+            if token in qm.token_map or token in pm.token_map:
+                return name
+        return None
+
+    def remove(self, token: int):
+        """Remove a token from whichever line holds it. Returns the removed item or None."""
+        line = self.locate(token)
+        if line is None:
+            return None
+        qm, pm = self.lines[line]
+        removed = qm.find_and_remove(token) if token in qm.token_map else pm.remove_by_token(token)
+        self.touch(line)
+        return removed
+
+    def total_waiting(self) -> int:
+        return sum(len(qm.queue) + len(pm.token_map) for qm, pm in self.lines.values())
+
+    # -------------------------
+    # Dispatcher
+    # -------------------------
+    def set_policy(self, policy: str):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown dispatch policy: {policy}")
+        if policy != self.policy:
+            self.policy = policy
+            self.refresh()
+
+    def refresh(self):
+        """Drop all dispatch heaps; they are rebuilt on demand. Call after bulk loads."""
+        self._heaps = {}
+
+    def line_key(self, name: str) -> Optional[tuple]:
+        """Sort key of a line under the current policy (smaller is better), or None if empty."""
+        qm, pm = self.lines[name]
+        if not qm.queue and not pm.heap:
+            return None
+        top_priority = -pm.heap[0][0] if pm.heap else 0
+        if self.policy == "oldest":
+            head_timestamp = pm.heap[0][2].timestamp if pm.heap else qm.queue[0].timestamp
+            return (-top_priority, head_timestamp)
+        return (-top_priority, -(len(qm.queue) + len(pm.token_map)))
+
+    def touch(self, name: str):
+        """
+        Re-rank a line after its contents changed. Needed when an empty line gains customers
+        outside add_customer(); other changes are picked up lazily by best_line().
+        """
+        key = self.line_key(name)
+        if key is None:
+            return
+        for skills, heap in list(self._heaps.items()):
+            if skills is None or name in skills:
+                heapq.heappush(heap, (key, name))
+                if len(heap) > 2 * len(self.lines) + 16:
+                    self._heaps[skills] = self._build_heap(skills)
+
+    def _build_heap(self, skills: Optional[FrozenSet[str]]) -> list:
+        names = self.lines if skills is None else [n for n in skills if n in self.lines]
+        heap = []
+        for name in names:
+            key = self.line_key(name)
+            if key is not None:
+                heap.append((key, name))
+        heapq.heapify(heap)
+        return heap
+
+    def best_line(self, lines: Optional[List[str]] = None) -> Optional[str]:
+        """
+        Return the best line with waiting customers among `lines` (None = all lines), or None.
+        """
+        skills = None if lines is None else frozenset(lines)
+        heap = self._heaps.get(skills)
+        if heap is None:
+            heap = self._heaps[skills] = self._build_heap(skills)
+        while heap:
+            key, name = heap[0]
+            current = self.line_key(name)
+            if current == key:
+                return name
+            heapq.heappop(heap)
+            if current is not None:
+                heapq.heappush(heap, (current, name))
+        return None
+
+    def serve_next(self, counter_manager) -> Optional[Dict]:
+        """
+        Assign the topmost available counter that can serve a waiting line to that line's
+        next customer (priority first). Counters with nothing to serve stay available.
+        Returns {'counter', 'line', 'item', 'source'} or None if no counter/customer matches.
+        """
+        chosen = {}
+
+        def can_serve(counter_id):
+            chosen[counter_id] = self.best_line(counter_manager.counter_lines(counter_id))
+            return chosen[counter_id] is not None
+
+        counter = counter_manager.pop_counter_where(can_serve)
+        if counter is None:
+            return None
+        line = chosen[counter]
+        qm, pm = self.lines[line]
+        item = pm.get_next_priority_customer()
+        source = "priority"
+        if item is None:
+            item = qm.dequeue()
+            source = "normal"
+        self.touch(line)
+        return {"counter": counter, "line": line, "item": item, "source": source}
+
+    # -------------------------
+    # Persistence
+    # -------------------------
+    def to_dict(self) -> Dict:
+        """
+        Serialize the policy and the extra lines. The default line is saved through
+        its own QueueManager / PriorityManager.
+        """
+        return {
+            "policy": self.policy,
+            "lines": {name: {"queue_manager": qm.to_dict(), "priority_manager": pm.to_dict()}
+                      for name, (qm, pm) in self.lines.items() if name != self.default_line}
+        }
+
+    def load_from_dict(self, data: Dict):
+        self.policy = data.get("policy", self.policy)
+        self.lines = {self.default_line: self.lines[self.default_line]}
+        for name, d in data.get("lines", {}).items():
+            qm, pm = self.add_line(name)
+            qm.load_from_dict(d.get("queue_manager", {}))
+            pm.load_from_dict(d.get("priority_manager", {}))
+        self.refresh()
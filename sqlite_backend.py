@@ -0,0 +1,379 @@
+# sqlite_backend.py
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from queue_manager import DEFAULT_LINE
+from storage_backend import StorageBackend
+
+# Bump when SCHEMA changes and add the matching steps to SQLiteBackend._migrate()
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS queue_entries (
+    token     INTEGER PRIMARY KEY,
+    name      TEXT NOT NULL,
+    type      TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    line      TEXT NOT NULL,
+    seq       INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_queue_entries_line_seq ON queue_entries(line, seq);
+CREATE TABLE IF NOT EXISTS priority_entries (
+    token          INTEGER PRIMARY KEY,
+    name           TEXT NOT NULL,
+    priority_level INTEGER NOT NULL,
+    type           TEXT NOT NULL,
+    timestamp      REAL NOT NULL,
+    line           TEXT NOT NULL,
+    seq            INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_priority_entries_order ON priority_entries(line, priority_level DESC, seq);
+CREATE TABLE IF NOT EXISTS service_lines (
+    name TEXT PRIMARY KEY,
+    seq  INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    counter_id TEXT PRIMARY KEY,
+    lines      TEXT,
+    available  INTEGER NOT NULL,
+    seq        INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS service_events (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp  REAL NOT NULL,
+    token      INTEGER,
+    counter_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_service_events_timestamp ON service_events(timestamp);
+CREATE TABLE IF NOT EXISTS expired_entries (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    token      INTEGER NOT NULL,
+    type       TEXT,
+    line       TEXT,
+    container  TEXT NOT NULL,
+    reason     TEXT NOT NULL,
+    expired_at REAL NOT NULL,
+    item       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_expired_entries_expired_at ON expired_entries(expired_at);
+CREATE TABLE IF NOT EXISTS undo_operations (
+    id     INTEGER PRIMARY KEY AUTOINCREMENT,
+    action TEXT NOT NULL,
+    data   TEXT NOT NULL
+);
+"""
+
+class SQLiteBackend(StorageBackend):
+    """
+    Stores the queue system state in an embedded SQLite database.
+    Each table is indexed for its access pattern, the database runs in WAL mode,
+    and single operations are single-row writes instead of a full rewrite.
+    Use batch() to group several writes into one transaction.
+    """
+
+    def __init__(self, filename: str = "smartqueue_state.db"):
+        self.filename = Path(filename)
+        # Streamlit reruns the script on different threads, so guard the shared connection.
+        self._lock = threading.RLock()
+        self._depth = 0  # nesting level of batch()
+        self.conn = sqlite3.connect(str(self.filename), isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+        self.conn.executescript(SCHEMA)
+        self.conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('schema_version', ?)",
+                          (str(SCHEMA_VERSION),))
+
+    def _columns(self, table: str) -> List[str]:
+        return [row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")]
+
+    def _migrate(self):
+        """
+        Upgrade a database written by an older version before SCHEMA is applied.
+        Version 1 (no schema_version in meta) had no service lines: queue and priority
+        entries lack `line`, counters lack `lines` / `available`, and two indexes
+        were defined on other columns.
+        """
+        if "value" not in self._columns("meta"):
+            return  # new database, SCHEMA creates everything
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        version = int(row[0]) if row else 1
+        if version >= SCHEMA_VERSION:
+            return
+        with self.batch():
+            if version < 2:
+                # existing rows belonged to the only line there was
+                for table in ("queue_entries", "priority_entries"):
+                    if "line" not in self._columns(table):
+                        self.conn.execute(
+                            f"ALTER TABLE {table} ADD COLUMN line TEXT NOT NULL DEFAULT '{DEFAULT_LINE}'")
+                if "lines" not in self._columns("counters"):
+                    self.conn.execute("ALTER TABLE counters ADD COLUMN lines TEXT")
+                if "available" not in self._columns("counters"):
+                    # version 1 only stored available counters
+                    self.conn.execute("ALTER TABLE counters ADD COLUMN available INTEGER NOT NULL DEFAULT 1")
+                # recreated on the new columns by SCHEMA
+                self.conn.execute("DROP INDEX IF EXISTS idx_queue_entries_seq")
+                self.conn.execute("DROP INDEX IF EXISTS idx_priority_entries_order")
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    @contextmanager
+    def batch(self):
+        """
+        Run the enclosed writes in a single transaction. Nested batches join the outer one.
+        """
+        with self._lock:
+            if self._depth == 0:
+                self.conn.execute("BEGIN")
+            self._depth += 1
+            try:
+                yield self
+            except Exception:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.conn.execute("ROLLBACK")
+                raise
+            self._depth -= 1
+            if self._depth == 0:
+                self.conn.execute("COMMIT")
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            return self.conn.execute(sql, params)
+
+    # -------------------------
+    # Full snapshots
+    # -------------------------
+    def save_to_file(self, queue_manager, priority_manager, service_manager, analytics, undo_stack=None,
+                     service_lines=None, expiry_manager=None):
+        """
+        Replace the stored state with the current in-memory state in one transaction.
+        service_events is append-only history kept by record_service() / remove_service()
+        (with token and counter); it is only seeded from analytics when still empty.
+        """
+        lines = service_lines.lines if service_lines is not None \
+            else {queue_manager.line: (queue_manager, priority_manager)}
+        with self.batch():
+            for table in ("queue_entries", "priority_entries", "service_lines", "counters",
+                          "expired_entries", "undo_operations"):
+                self.conn.execute(f"DELETE FROM {table}")
+            self._write_meta(queue_manager, priority_manager)
+            if service_lines is not None:
+                self.conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('dispatch_policy', ?)",
+                                  (service_lines.policy,))
+            if expiry_manager is not None:
+                self.conn.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('expiry_policies', ?)",
+                                  (json.dumps(expiry_manager.to_dict()),))
+            self.conn.executemany(
+                "INSERT INTO service_lines(name, seq) VALUES (?, ?)",
+                [(name, seq) for seq, name in enumerate(lines)])
+            for line, (qm, pm) in lines.items():
+                self.conn.executemany(
+                    "INSERT INTO queue_entries(token, name, type, timestamp, line, seq) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(i.token, i.name, i.type, i.timestamp, line, seq) for seq, i in enumerate(qm.queue)])
+                self.conn.executemany(
+                    "INSERT INTO priority_entries(token, name, priority_level, type, timestamp, line, seq) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(d['token'], d['name'], d['priority_level'], d['type'], d['timestamp'], line, seq)
+                     for seq, d in enumerate(pm.peek_all())])
+            available = service_manager.available_counters()
+            busy = [c for c in service_manager.skills if c not in available]
+            self.conn.executemany(
+                "INSERT INTO counters(counter_id, lines, available, seq) VALUES (?, ?, ?, ?)",
+                [(c, self._encode_lines(service_manager.counter_lines(c)), int(c in available), seq)
+                 for seq, c in enumerate(available + busy)])
+            if self.conn.execute("SELECT 1 FROM service_events LIMIT 1").fetchone() is None:
+                self.conn.executemany(
+                    "INSERT INTO service_events(timestamp) VALUES (?)",
+                    [(ts,) for ts in getattr(analytics, "served_timestamps", [])])
+            for entry in getattr(analytics, "expired_entries", []):
+                self._insert_expiry(entry)
+            self.conn.executemany(
+                "INSERT INTO undo_operations(action, data) VALUES (?, ?)",
+                [(op['action'], json.dumps(op['data'])) for op in getattr(undo_stack, "stack", [])])
+        return str(self.filename.resolve())
+
+    def load_from_file(self, queue_manager, priority_manager, service_manager, analytics, undo_stack=None,
+                       service_lines=None, expiry_manager=None):
+        """
+        Restore state from the database. Returns True if loaded, False if nothing was saved yet.
+        """
+        with self._lock:
+            meta = dict(self.conn.execute("SELECT key, value FROM meta").fetchall())
+            meta.pop("schema_version", None)
+            if not meta:
+                return False
+            line_names = [n for (n,) in self.conn.execute("SELECT name FROM service_lines ORDER BY seq")]
+            queue = self.conn.execute(
+                "SELECT token, name, type, timestamp, line FROM queue_entries ORDER BY line, seq").fetchall()
+            heap = self.conn.execute(
+                "SELECT token, name, priority_level, type, timestamp, line FROM priority_entries "
+                "ORDER BY line, priority_level DESC, seq").fetchall()
+            counters = self.conn.execute("SELECT counter_id, lines, available FROM counters ORDER BY seq").fetchall()
+            served = self.conn.execute("SELECT timestamp FROM service_events ORDER BY id").fetchall()
+            expired = self.conn.execute(
+                "SELECT item, container, reason, expired_at FROM expired_entries ORDER BY id").fetchall()
+            undo_ops = self.conn.execute("SELECT action, data FROM undo_operations ORDER BY id").fetchall()
+        # group rows per service line, in the shape QueueManager / PriorityManager.load_from_dict expect
+        lines = {name: {"queue": [], "heap": []} for name in line_names}
+        lines.setdefault(queue_manager.line, {"queue": [], "heap": []})
+        for t, n, ty, ts, line in queue:
+            lines.setdefault(line, {"queue": [], "heap": []})["queue"].append(
+                {"token": t, "name": n, "type": ty, "timestamp": ts})
+        for t, n, p, ty, ts, line in heap:
+            lines.setdefault(line, {"queue": [], "heap": []})["heap"].append(
+                {"token": t, "name": n, "priority_level": p, "type": ty, "timestamp": ts})
+        default = lines.pop(queue_manager.line)
+        queue_manager.load_from_dict({
+            "next_token": int(meta.get("next_token", queue_manager.next_token)),
+            "avg_service_time": int(meta.get("avg_service_time", queue_manager.avg_service_time)),
+            "queue": default["queue"]
+        })
+        priority_manager.load_from_dict({"heap": default["heap"], "counter": 0})
+        if service_lines is not None:
+            service_lines.load_from_dict({
+                "policy": meta.get("dispatch_policy", service_lines.policy),
+                "lines": {name: {"queue_manager": {"avg_service_time": queue_manager.avg_service_time,
+                                                   "queue": rows["queue"]},
+                                 "priority_manager": {"heap": rows["heap"], "counter": 0}}
+                          for name, rows in lines.items()}
+            })
+        service_manager.load_from_dict({
+            "available": [c for c, _, avail in counters if avail],
+            "skills": {c: json.loads(l) for c, l, _ in counters if l is not None}
+        })
+        analytics.served_timestamps = [ts for (ts,) in served]
+        analytics.expired_entries = [{"item": json.loads(i), "container": c, "reason": r, "expired_at": at}
+                                     for i, c, r, at in expired]
+        if expiry_manager is not None and "expiry_policies" in meta:
+            expiry_manager.load_from_dict(json.loads(meta["expiry_policies"]))
+        if undo_stack is not None:
+            undo_stack.stack = [{"action": a, "data": json.loads(d)} for a, d in undo_ops]
+        return True
+
+    def _write_meta(self, queue_manager, priority_manager):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)",
+            [("next_token", str(queue_manager.next_token)),
+             ("avg_service_time", str(queue_manager.avg_service_time))])
+
+    @staticmethod
+    def _encode_lines(lines: Optional[List[str]]) -> Optional[str]:
+        return None if lines is None else json.dumps(list(lines))
+
+    # -------------------------
+    # Incremental hooks
+    # -------------------------
+    def add_queue_entry(self, item, front: bool = False):
+        line = getattr(item, "line", DEFAULT_LINE)
+        seq_sql = "(SELECT COALESCE(MIN(seq), 0) - 1 FROM queue_entries WHERE line = ?)" if front \
+            else "(SELECT COALESCE(MAX(seq), 0) + 1 FROM queue_entries WHERE line = ?)"
+        self._execute(
+            "INSERT OR REPLACE INTO queue_entries(token, name, type, timestamp, line, seq) "
+            f"VALUES (?, ?, ?, ?, ?, {seq_sql})",
+            (item.token, item.name, item.type, item.timestamp, line, line))
+
+    def remove_queue_entry(self, token: int):
+        self._execute("DELETE FROM queue_entries WHERE token = ?", (token,))
+
+    def add_priority_entry(self, customer):
+        self._execute(
+            "INSERT OR REPLACE INTO priority_entries(token, name, priority_level, type, timestamp, line, seq) "
+            "VALUES (?, ?, ?, ?, ?, ?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM priority_entries))",
+            (customer.token, customer.name, customer.priority_level, customer.type, customer.timestamp,
+             getattr(customer, "line", DEFAULT_LINE)))
+
+    def remove_priority_entry(self, token: int):
+        self._execute("DELETE FROM priority_entries WHERE token = ?", (token,))
+
+    def add_line(self, name: str):
+        self._execute(
+            "INSERT OR IGNORE INTO service_lines(name, seq) "
+            "VALUES (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM service_lines))",
+            (name,))
+
+    def add_counter(self, counter_id: str, lines: Optional[List[str]] = None):
+        # an already-available counter keeps its place on the stack, like push_counter()
+        with self.batch():
+            self._execute(
+                "INSERT OR IGNORE INTO counters(counter_id, lines, available, seq) "
+                "VALUES (?, NULL, 0, 0)", (counter_id,))
+            self._execute(
+                "UPDATE counters SET available = 1, seq = (SELECT COALESCE(MAX(seq), 0) + 1 FROM counters) "
+                "WHERE counter_id = ? AND available = 0", (counter_id,))
+            if lines is not None:
+                self._execute("UPDATE counters SET lines = ? WHERE counter_id = ?",
+                              (self._encode_lines(lines), counter_id))
+
+    def remove_counter(self, counter_id: str):
+        self._execute("UPDATE counters SET available = 0 WHERE counter_id = ?", (counter_id,))
+
+    def record_service(self, timestamp: float, token: Optional[int] = None, counter_id: Optional[str] = None):
+        self._execute("INSERT INTO service_events(timestamp, token, counter_id) VALUES (?, ?, ?)",
+                      (timestamp, token, counter_id))
+
+    def remove_service(self, timestamp: float, token: Optional[int] = None):
+        self._execute(
+            "DELETE FROM service_events WHERE id = (SELECT MAX(id) FROM service_events "
+            "WHERE timestamp = ? AND (token = ? OR token IS NULL OR ? IS NULL))", (timestamp, token, token))
+
+    def _insert_expiry(self, entry: Dict):
+        item = entry["item"]
+        self._execute(
+            "INSERT INTO expired_entries(token, type, line, container, reason, expired_at, item) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (item["token"], item.get("type"), item.get("line"), entry["container"], entry["reason"],
+             entry["expired_at"], json.dumps(item)))
+
+    def record_expiry(self, entry: Dict):
+        self._insert_expiry(entry)
+
+    def remove_expiry(self, entry: Dict):
+        self._execute("DELETE FROM expired_entries WHERE token = ? AND expired_at = ?",
+                      (entry["item"]["token"], entry["expired_at"]))
+
+    def push_undo(self, action: str, data: Dict):
+        self._execute("INSERT INTO undo_operations(action, data) VALUES (?, ?)", (action, json.dumps(data)))
+
+    def pop_undo(self):
+        self._execute("DELETE FROM undo_operations WHERE id = (SELECT MAX(id) FROM undo_operations)")
+
+    def set_meta(self, key: str, value):
+        self._execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (key, str(value)))
+
+    # -------------------------
+    # History queries
+    # -------------------------
+    def services_per_hour(self) -> List[int]:
+        """Served counts per local hour of day, aggregated in SQL."""
+        counts = [0] * 24
+        rows = self._execute(
+            "SELECT CAST(strftime('%H', timestamp, 'unixepoch', 'localtime') AS INTEGER), COUNT(*) "
+            "FROM service_events GROUP BY 1").fetchall()
+        for hour, count in rows:
+            counts[hour] = count
+        return counts
+
+    def services_between(self, start: float, end: float) -> List[Dict]:
+        """Service events with start <= timestamp < end, oldest first (uses the timestamp index)."""
+        rows = self._execute(
+            "SELECT timestamp, token, counter_id FROM service_events "
+            "WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp", (start, end)).fetchall()
+        return [{"timestamp": ts, "token": t, "counter_id": c} for ts, t, c in rows]
+
+    def expiry_counts(self) -> Dict:
+        """Expired tokens by reason and by user type, counted in SQL (same shape as Analytics.expiry_counts)."""
+        by_reason = dict(self._execute("SELECT reason, COUNT(*) FROM expired_entries GROUP BY reason").fetchall())
+        by_type = dict(self._execute("SELECT type, COUNT(*) FROM expired_entries GROUP BY type").fetchall())
+        return {"total": sum(by_reason.values()), "by_reason": by_reason, "by_type": by_type}
@@ -0,0 +1,112 @@
+# storage_backend.py
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+class StorageBackend:
+    """
+    Interface for persisting the queue system state.
+    Every backend supports full snapshots through save_to_file() / load_from_file().
+    Backends that can write single rows (e.g. SQLite) also override the
+    incremental hooks below; snapshot-only backends (the JSON FileHandler)
+    inherit the no-op versions and persist on the next explicit save.
+    """
+
+    def save_to_file(self, queue_manager, priority_manager, service_manager, analytics, undo_stack=None,
+                     service_lines=None, expiry_manager=None):
+        """
+        Persist a full snapshot of the current state. queue_manager / priority_manager hold the
+        default service line; service_lines (a ServiceLineManager) holds the others;
+        expiry_manager contributes its per-type policies.
+        Returns a description of where it went.
+        """
+        raise NotImplementedError
+
+    def load_from_file(self, queue_manager, priority_manager, service_manager, analytics, undo_stack=None,
+                       service_lines=None, expiry_manager=None) -> bool:
+        """Restore state into the given managers. Returns True if anything was loaded."""
+        raise NotImplementedError
+
+    @contextmanager
+    def batch(self):
+        """Group several incremental writes into one transaction (no-op by default)."""
+        yield self
+
+    # -------------------------
+    # Incremental hooks (single-row writes)
+    # -------------------------
+    def add_queue_entry(self, item, front: bool = False):
+        """A QueueItem joined the normal queue (at the tail, or at the head if front=True)."""
+        pass
+
+    def remove_queue_entry(self, token: int):
+        """A token left the normal queue (served or removed)."""
+        pass
+
+    def add_priority_entry(self, customer):
+        """A PriorityCustomer joined the priority queue."""
+        pass
+
+    def remove_priority_entry(self, token: int):
+        """A token left the priority queue (served or removed)."""
+        pass
+
+    def add_line(self, name: str):
+        """A service line was created."""
+        pass
+
+    def add_counter(self, counter_id: str, lines: Optional[List[str]] = None):
+        """A counter became available. lines: service lines it serves (None = all)."""
+        pass
+
+    def remove_counter(self, counter_id: str):
+        """A counter was assigned and is no longer available."""
+        pass
+
+    def record_service(self, timestamp: float, token: Optional[int] = None, counter_id: Optional[str] = None):
+        """A customer was served."""
+        pass
+
+    def remove_service(self, timestamp: float, token: Optional[int] = None):
+        """A recorded service is withdrawn (the called customer did not show up)."""
+        pass
+
+    def record_expiry(self, entry: Dict):
+        """A token expired (entry from ExpiryManager: item, container, reason, expired_at)."""
+        pass
+
+    def remove_expiry(self, entry: Dict):
+        """An expired token was restored to its queue."""
+        pass
+
+    def push_undo(self, action: str, data: Dict):
+        """An operation was pushed on the undo stack."""
+        pass
+
+    def pop_undo(self):
+        """The top undo operation was consumed."""
+        pass
+
+    def set_meta(self, key: str, value):
+        """Store a scalar setting such as next_token or avg_service_time."""
+        pass
+
+    # -------------------------
+    # History queries
+    # -------------------------
+    def services_per_hour(self) -> Optional[List[int]]:
+        """
+        Return served counts per hour of day (24 ints), or None if the backend
+        cannot answer without loading the state (callers fall back to Analytics).
+        """
+        return None
+
+    def services_between(self, start: float, end: float) -> Optional[List[Dict]]:
+        """
+        Return service events {timestamp, token, counter_id} with start <= timestamp < end,
+        or None if not supported (callers fall back to Analytics.served_timestamps).
+        """
+        return None
+
+    def expiry_counts(self) -> Optional[Dict]:
+        """Return expired token counts like Analytics.expiry_counts(), or None if not supported."""
+        return None
@@ -39,15 +39,10 @@ class UndoStack:
             # revert dequeue -> put item back to front of queue
             item = data.get('item')
             if item:
-                # create object-like again
-                # insert at left
-                queue_manager.queue.appendleft(queue_manager.QueueItem if hasattr(queue_manager, 'QueueItem') else None)
-                # simpler: we will reconstruct QueueItem using queue_manager internals
-                # However to avoid complexity, we will re-create a QueueItem using the module's class
+                # re-create a QueueItem using the module's class and insert at left
                 from queue_manager import QueueItem  # local import to avoid cycle in top-level
-                qitem = QueueItem(item['token'], item['name'], item['type'], item['timestamp'])
-                queue_manager.queue.appendleft(qitem)
-                queue_manager.token_map[qitem.token] = qitem
+                qitem = QueueItem(item['token'], item['name'], item['type'], item['timestamp'], queue_manager.line)
+                queue_manager.requeue(qitem, front=True)
                 return {"undone": "dequeue", "token": qitem.token}
             return {"undone": "dequeue", "info": "no item data"}
         elif action == 'remove':
@@ -58,9 +53,8 @@ class UndoStack:
                 return {"undone": "remove", "info": "no item data"}
             if container == 'normal':
                 from queue_manager import QueueItem
-                qitem = QueueItem(item['token'], item['name'], item['type'], item['timestamp'])
-                queue_manager.queue.append(qitem)  # append back to tail
-                queue_manager.token_map[qitem.token] = qitem
+                qitem = QueueItem(item['token'], item['name'], item['type'], item['timestamp'], queue_manager.line)
+                queue_manager.requeue(qitem)  # append back to tail
                 return {"undone": "remove", "token": qitem.token}
             elif container == 'priority':
                 # re-add priority
@@ -10,7 +10,8 @@ class UserSearch:
     """
 
     @staticmethod
-    def find_user_by_token(token:int, normal_token_map:Dict[int, object], priority_token_map:Dict[int, object], queue_manager=None):
+    def find_user_by_token(token:int, normal_token_map:Dict[int, object], priority_token_map:Dict[int, object], queue_manager=None,
+                           priority_manager=None):
         """
         Return a tuple (location, type, position, estimated_seconds)
         location: 'normal', 'priority', or 'not_found'
@@ -28,7 +29,11 @@ class UserSearch:
             # priority_token_map values are PriorityCustomer objects, we only know they exist
             # We'll return position as unknown (-1) unless caller provides priority_manager for ranking
             item = priority_token_map[token]
-            return ("priority", item.type, -1, -1)
+            if priority_manager is None:
+                return ("priority", item.type, -1, -1)
+            pos = priority_manager.get_position(token)
+            avg = queue_manager.avg_service_time if queue_manager else None
+            return ("priority", item.type, pos, (pos - 1) * avg if avg and pos > 0 else -1)
         return ("not_found", None, -1, -1)
 
     @staticmethod